@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2025 Ryo Funai
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+PGM変換用のNumbaカーネル（numbaが利用可能な場合のみModelから遅延importされる）
+"""
+import os
+import numpy as np
+from numba import config, get_num_threads, njit, prange
+
+# カーネルはGUIのワーカースレッドから呼ばれる。TBBスレッド層はメイン以外のスレッドで並列領域を
+# 初めて起動すると（PyQt5と併用時に）プロセス終了時にハングするため、利用者の指定が無ければ後回しにする
+if "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+    config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+_UINT16_MAX = 65535
+# スレッドごとの作業格子に使うセル数の合計の上限（uint16で64MiB）
+_SCRATCH_CELLS = 1 << 25
+
+def scratch_chunks(n_points: int, n_cells: int) -> int:
+    """スレッドごとの作業格子の枚数を返す（1以下なら作業格子を使わずoutへ直接集計する）"""
+    # 格子が点数に比べて大きい場合は、作業格子の確保と合算の方が集計より高くつく
+    return min(get_num_threads(), n_points // n_cells, _SCRATCH_CELLS // n_cells)
+
+def rasterize(x, y, min_x, min_y, inv_res, res_x, res_y, out, scratch=None):
+    """XY座標を格子に量子化し、セルごとの点数をout(res_x, res_y)へ書き込む
+
+    scratchに(n_chunks, res_x * res_y)のuint16作業格子を渡すと、n_chunks並列で集計する
+    """
+    flat_out = out.reshape(res_x * res_y)
+    if scratch is None or scratch.shape[0] < 2:
+        _rasterize_serial(x, y, min_x, min_y, inv_res, res_x, res_y, flat_out)
+    else:
+        _rasterize_parallel(x, y, min_x, min_y, inv_res, res_x, res_y, scratch, flat_out)
+
+@njit(fastmath=True, cache=True)
+def _cell_index(x, y, min_x, min_y, inv_res, res_x, res_y):
+    ix = int(np.floor((x - min_x) * inv_res))
+    iy = int(np.floor((y - min_y) * inv_res))
+    ix = min(max(ix, 0), res_x - 1)
+    iy = min(max(iy, 0), res_y - 1)
+    return ix * res_y + iy
+
+@njit(fastmath=True, cache=True)
+def _rasterize_serial(x, y, min_x, min_y, inv_res, res_x, res_y, flat_out):
+    flat_out[:] = 0
+    for i in range(x.shape[0]):
+        k = _cell_index(x[i], y[i], min_x, min_y, inv_res, res_x, res_y)
+        # uint16の桁あふれで占有判定が反転しないよう飽和させる
+        if flat_out[k] < _UINT16_MAX:
+            flat_out[k] += 1
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _rasterize_parallel(x, y, min_x, min_y, inv_res, res_x, res_y, local, flat_out):
+    n = x.shape[0]
+    n_chunks = local.shape[0]
+    n_cells = res_x * res_y
+    chunk = (n + n_chunks - 1) // n_chunks
+
+    # スレッドごとに専用の格子へ加算し、最後にまとめて合算する
+    for c in prange(n_chunks):
+        grid = local[c]
+        grid[:] = 0
+        end = min(n, (c + 1) * chunk)
+        for i in range(c * chunk, end):
+            k = _cell_index(x[i], y[i], min_x, min_y, inv_res, res_x, res_y)
+            if grid[k] < _UINT16_MAX:
+                grid[k] += 1
+
+    for k in prange(n_cells):
+        total = 0
+        for c in range(n_chunks):
+            total += local[c, k]
+        flat_out[k] = min(total, _UINT16_MAX)
+
+def warmup() -> None:
+    """JITコンパイルを事前に済ませる（cache=Trueのため、2回目以降の起動ではキャッシュの読み込みのみ）"""
+    coords = np.zeros(2, dtype=np.float32)
+    out = np.zeros((1, 1), dtype=np.uint16)
+    rasterize(coords, coords, 0.0, 0.0, 1.0, 1, 1, out)
+    rasterize(coords, coords, 0.0, 0.0, 1.0, 1, 1, out, np.zeros((2, 1), dtype=np.uint16))
@@ -5,10 +5,11 @@
 ModelとViewの仲介および各種ロジック処理
 """
 import sys
-import numpy as np
-from PyQt5 import QtWidgets, QtCore
+from PyQt5 import QtWidgets
 from .model import IPointCloudModel
-from .view import IPointCloudView
+from .view import IPointCloudView, signals_blocked
+from .converter import PointCloudConvertThread
+from .throttler import QSignalThrottler
 
 class PointCloudController:
     def __init__(
@@ -22,11 +23,11 @@ class PointCloudController:
         self.view = view
         self.loader = loader
         self.output_dir = output_dir
+        self.convert_thread = None
 
         self.timer_interval = 10  # [ms]
-        self.update_timer = QtCore.QTimer()
-        self.update_timer.setSingleShot(True)
-        self.update_timer.timeout.connect(self.update_filter)
+        self.update_throttler = QSignalThrottler(self.timer_interval)
+        self.update_throttler.triggered.connect(self.update_filter)
 
         self._connect_signals()
 
@@ -44,6 +45,7 @@ class PointCloudController:
         self.view.convert_button.clicked.connect(self.on_convert)
         self.view.set_output_filename_button.clicked.connect(self.on_set_output_filename)
         self.view.set_resolution_button.clicked.connect(self.on_set_resolution)
+        self.model.z_range_changed.connect(self.on_z_range_changed)
 
     def on_point_cloud_loaded(self, pcd) -> None:
         try:
@@ -57,17 +59,21 @@ class PointCloudController:
         current_min = self.model.current_min_z
         current_max = self.model.current_max_z
 
-        self.view.zmin_spin.setRange(overall_min, overall_max)
-        self.view.zmin_spin.setValue(current_min)
-        self.view.zmin_slider.setMinimum(int(overall_min * self.view.slider_multiplier))
-        self.view.zmin_slider.setMaximum(int(overall_max * self.view.slider_multiplier))
-        self.view.zmin_slider.setValue(int(current_min * self.view.slider_multiplier))
-
-        self.view.zmax_spin.setRange(overall_min, overall_max)
-        self.view.zmax_spin.setValue(current_max)
-        self.view.zmax_slider.setMinimum(int(overall_min * self.view.slider_multiplier))
-        self.view.zmax_slider.setMaximum(int(overall_max * self.view.slider_multiplier))
-        self.view.zmax_slider.setValue(int(current_max * self.view.slider_multiplier))
+        # 範囲設定の途中で値がクランプされてもコールバックが連鎖しないよう、シグナルを止めて一括設定する
+        with signals_blocked(
+            self.view.zmin_spin, self.view.zmin_slider, self.view.zmax_spin, self.view.zmax_slider
+        ):
+            self.view.zmin_spin.setRange(overall_min, overall_max)
+            self.view.zmin_spin.setValue(current_min)
+            self.view.zmin_slider.setMinimum(int(overall_min * self.view.slider_multiplier))
+            self.view.zmin_slider.setMaximum(int(overall_max * self.view.slider_multiplier))
+            self.view.zmin_slider.setValue(int(current_min * self.view.slider_multiplier))
+
+            self.view.zmax_spin.setRange(overall_min, overall_max)
+            self.view.zmax_spin.setValue(current_max)
+            self.view.zmax_slider.setMinimum(int(overall_min * self.view.slider_multiplier))
+            self.view.zmax_slider.setMaximum(int(overall_max * self.view.slider_multiplier))
+            self.view.zmax_slider.setValue(int(current_max * self.view.slider_multiplier))
 
         # 初期表示：モデルの全点群データを描画
         full_poly = self.model.display_cloud
@@ -105,43 +111,33 @@ class PointCloudController:
         sys.exit(1)
 
     def on_zmin_changed(self, value: float) -> None:
-        self.model.current_min_z = value
-        self.view.update_slider_value(self.view.zmin_slider, value)
-        if self.model.current_min_z > self.model.current_max_z:
-            self.model.current_max_z = self.model.current_min_z
-            self.view.update_spin_value(self.view.zmax_spin, self.model.current_max_z)
-            self.view.update_slider_value(self.view.zmax_slider, self.model.current_max_z)
-        self.update_timer.start(self.timer_interval)
+        # min zがmax zを超えた場合はmax zも追従させる
+        self._apply_z_range(value, max(value, self.model.current_max_z))
 
     def on_zmax_changed(self, value: float) -> None:
-        self.model.current_max_z = value
-        self.view.update_slider_value(self.view.zmax_slider, value)
-        if self.model.current_max_z < self.model.current_min_z:
-            self.model.current_min_z = self.model.current_max_z
-            self.view.update_spin_value(self.view.zmin_spin, self.model.current_min_z)
-            self.view.update_slider_value(self.view.zmin_slider, self.model.current_min_z)
-        self.update_timer.start(self.timer_interval)
+        # max zがmin zを下回った場合はmin zも追従させる
+        self._apply_z_range(min(value, self.model.current_min_z), value)
 
     def on_zmin_slider_changed(self, slider_value: int) -> None:
-        new_value = slider_value / self.view.slider_multiplier
-        self.view.update_spin_value(self.view.zmin_spin, new_value)
-        self.model.current_min_z = new_value
-        self.update_timer.start(self.timer_interval)
+        self.on_zmin_changed(slider_value / self.view.slider_multiplier)
 
     def on_zmax_slider_changed(self, slider_value: int) -> None:
-        new_value = slider_value / self.view.slider_multiplier
-        self.view.update_spin_value(self.view.zmax_spin, new_value)
-        self.model.current_max_z = new_value
-        self.update_timer.start(self.timer_interval)
+        self.on_zmax_changed(slider_value / self.view.slider_multiplier)
 
     def on_reset(self) -> None:
-        self.model.current_min_z = self.model.overall_z_min
-        self.model.current_max_z = self.model.overall_z_max
-        self.view.update_spin_value(self.view.zmin_spin, self.model.current_min_z)
-        self.view.update_spin_value(self.view.zmax_spin, self.model.current_max_z)
-        self.view.update_slider_value(self.view.zmin_slider, self.model.current_min_z)
-        self.view.update_slider_value(self.view.zmax_slider, self.model.current_max_z)
-        self.update_timer.start(self.timer_interval)
+        self._apply_z_range(self.model.overall_z_min, self.model.overall_z_max)
+
+    def _apply_z_range(self, min_z: float, max_z: float) -> None:
+        # Z範囲はモデルが唯一の保持元で、ウィジェットへの反映はz_range_changedから一括で行う
+        self.model.set_z_range(min_z, max_z)
+
+    def on_z_range_changed(self, min_z: float, max_z: float) -> None:
+        # update_*_valueはシグナルを止めて設定するため、コールバックは再入しない
+        self.view.update_spin_value(self.view.zmin_spin, min_z)
+        self.view.update_slider_value(self.view.zmin_slider, min_z)
+        self.view.update_spin_value(self.view.zmax_spin, max_z)
+        self.view.update_slider_value(self.view.zmax_slider, max_z)
+        self.update_throttler.throttle()
 
     def update_filter(self) -> None:
         polydata = self.model.get_polydata(self.model.current_min_z, self.model.current_max_z)
@@ -153,17 +149,7 @@ class PointCloudController:
             self.view.plotter.render()
             return
 
-        if self.view.actor is not None and self.view.cloud_mesh is not None:
-            if self.view.cloud_mesh.n_points == polydata.n_points:
-                np.copyto(self.view.cloud_mesh.points, polydata.points)
-                self.view.cloud_mesh["z"] = polydata["z"]
-                self.view.cloud_mesh.Modified()
-            else:
-                new_mesh = polydata
-                mapper = self.view.actor.GetMapper()
-                mapper.SetInputData(new_mesh)
-                self.view.cloud_mesh = new_mesh
-        else:
+        if self.view.actor is None:
             self.view.actor = self.view.plotter.add_mesh(
                 polydata,
                 scalars="z",
@@ -184,6 +170,11 @@ class PointCloudController:
                 reset_camera=False
             )
             self.view.cloud_mesh = polydata
+        elif self.view.cloud_mesh is not polydata:
+            mapper = self.view.actor.GetMapper()
+            mapper.SetInputData(polydata)
+            self.view.cloud_mesh = polydata
+        # 描画中と同じPolyDataならモデル側で直接更新済み（または変化なし）のため、再描画のみ行う
         self.view.plotter.render()
 
     def on_set_output_filename(self) -> None:
@@ -216,18 +207,26 @@ class PointCloudController:
             self.view.plotter.render()
 
     def on_convert(self) -> None:
-        try:
-            pgm_path, yaml_path = self.model.convert_to_pgm(
-                self.model.current_min_z,
-                self.model.current_max_z,
-                self.view.user_resolution,
-                self.output_dir,
-                self.view.user_output_filename
-            )
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self.view, "Error", f"PGM/YAML出力時にエラーが発生しました: {e}")
-            return
+        # 変換はワーカースレッドで実行し、完了までボタンを無効化する
+        self.view.convert_button.setEnabled(False)
+        self.convert_thread = PointCloudConvertThread(
+            self.model,
+            self.model.current_min_z,
+            self.model.current_max_z,
+            self.view.user_resolution,
+            self.output_dir,
+            self.view.user_output_filename
+        )
+        self.convert_thread.finished_ok.connect(self._on_convert_done)
+        self.convert_thread.failed.connect(self._on_convert_failed)
+        self.convert_thread.start()
 
+    def _on_convert_done(self, pgm_path: str, yaml_path: str) -> None:
+        self.view.convert_button.setEnabled(True)
         message = f"PGMファイルを出力しました: {pgm_path}\nYAMLファイルを出力しました: {yaml_path}"
         QtWidgets.QMessageBox.information(self.view, "Success", message)
         self.view.show_pgm_image(pgm_path)
+
+    def _on_convert_failed(self, error_msg: str) -> None:
+        self.view.convert_button.setEnabled(True)
+        QtWidgets.QMessageBox.critical(self.view, "Error", f"PGM/YAML出力時にエラーが発生しました: {error_msg}")
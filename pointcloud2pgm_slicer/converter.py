@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: 2025 Ryo Funai
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+バックグラウンドでPGM/YAML変換を行う
+"""
+from PyQt5 import QtCore
+from .model import IPointCloudModel
+
+class PointCloudConvertThread(QtCore.QThread):
+    finished_ok = QtCore.pyqtSignal(str, str)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(
+        self,
+        model: IPointCloudModel,
+        min_z: float,
+        max_z: float,
+        resolution: float,
+        output_dir: str,
+        output_filename: str,
+        parent=None,
+    ) -> None:
+        super().__init__(parent)
+        self.model = model
+        # 変換中にGUI側で値が変更されても影響しないよう、開始時点の設定を保持
+        self.min_z = min_z
+        self.max_z = max_z
+        self.resolution = resolution
+        self.output_dir = output_dir
+        self.output_filename = output_filename
+
+    def run(self) -> None:
+        try:
+            pgm_path, yaml_path = self.model.convert_to_pgm(
+                self.min_z,
+                self.max_z,
+                self.resolution,
+                self.output_dir,
+                self.output_filename
+            )
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished_ok.emit(pgm_path, yaml_path)
@@ -6,6 +6,7 @@
 """
 from PyQt5 import QtCore
 import open3d as o3d
+from .model import warmup_kernels
 
 class PointCloudLoaderThread(QtCore.QThread):
     loaded = QtCore.pyqtSignal(object)
@@ -25,3 +26,6 @@ class PointCloudLoaderThread(QtCore.QThread):
             self.loaded.emit(pcd)
         except Exception as e:
             self.error.emit(str(e))
+            return
+        # 初回のPGM変換でJITコンパイル待ちが発生しないよう、読み込み後にこのスレッドで事前コンパイルしておく
+        warmup_kernels()
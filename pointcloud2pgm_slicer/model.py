@@ -4,23 +4,113 @@
 """
 点群データの保持、処理、およびPGM/YAML変換を行う
 """
-from abc import ABC, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
 import os
+import threading
 import numpy as np
 import open3d as o3d
 import pyvista as pv
+from PyQt5 import QtCore
 from typing import Optional, Tuple
 from .config import MIN_OCCUPIED_POINTS, VOXEL_SIZE
 
+# 描画用の点をMorton順に並べ替える単位（z昇順にこの点数ずつ区切ったブロック内で並べ替える）
+_MORTON_BLOCK_POINTS = 1 << 12
+# PGM変換のNumPy実装で1度に処理する点数（チャンクあたりfloat32で8MiB）
+_RASTER_CHUNK_POINTS = 1 << 21
+
+def _z_slice(z_sorted: np.ndarray, min_z: float, max_z: float) -> Tuple[int, int]:
+    """z昇順の配列からmin_z <= z <= max_zとなる区間[lo, hi)を二分探索で求める"""
+    lo = int(np.searchsorted(z_sorted, min_z, side="left"))
+    hi = int(np.searchsorted(z_sorted, max_z, side="right"))
+    return lo, hi
+
+def _to_float32(values: np.ndarray, offset: float) -> np.ndarray:
+    """values - offsetをfloat64で計算し、連続したfloat32配列として返す"""
+    out = np.empty(values.shape[0], dtype=np.float32)
+    np.subtract(values, offset, out=out, dtype=np.float64, casting="same_kind")
+    return out
+
+def _xy_bounds(x: np.ndarray, y: np.ndarray) -> Tuple[float, float, float, float]:
+    """XY範囲を(min_x, max_x, min_y, max_y)で返す"""
+    return float(x.min()), float(x.max()), float(y.min()), float(y.max())
+
+def _voxel_down_sample_indices(x: np.ndarray, y: np.ndarray, z: np.ndarray, voxel_size: float) -> np.ndarray:
+    """ボクセルごとに最初に現れる点のインデックスを昇順で返す"""
+    # 各軸のボクセル座標を21bitずつ1つのint64キーに詰める
+    mask = (1 << 21) - 1
+    kx = np.floor(x / voxel_size).astype(np.int64)
+    ky = np.floor(y / voxel_size).astype(np.int64)
+    kz = np.floor(z / voxel_size).astype(np.int64)
+    keys = (kx << 42) | ((ky & mask) << 21) | (kz & mask)
+    _, idx = np.unique(keys, return_index=True)
+    idx.sort()
+    return idx
+
+def _spread_bits_10(v: np.ndarray) -> np.ndarray:
+    """10bitの値を2bitおきに配置する（3次元Morton符号用）"""
+    v = v & 0x3FF
+    v = (v | (v << 16)) & 0x030000FF
+    v = (v | (v << 8)) & 0x0300F00F
+    v = (v | (v << 4)) & 0x030C30C3
+    v = (v | (v << 2)) & 0x09249249
+    return v
+
+_MORTON_LUT = _spread_bits_10(np.arange(1 << 10, dtype=np.uint32))
+
+def _morton_codes(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """点群の外接直方体を各軸10bitに量子化した30bitのMorton符号を返す"""
+    codes = np.zeros(x.shape[0], dtype=np.uint32)
+    for shift, values in enumerate((x, y, z)):
+        lo = float(values.min())
+        extent = float(values.max()) - lo
+        scale = 1023.0 / extent if extent > 0 else 0.0
+        q = ((values - lo) * scale).astype(np.intp)
+        codes |= _MORTON_LUT[q] << shift
+    return codes
+
+# 読み込み済みのNumbaカーネル（未読み込みはFalse、利用できない場合はNone）
+_kernel_module = False
+# Loaderスレッドの事前コンパイル中に変換スレッドからも読み込まれるため、読み込みは排他する
+_kernel_lock = threading.Lock()
+
+def _load_kernels():
+    """Numbaカーネルを遅延import・コンパイルする（numbaが無い、またはコンパイルに失敗した場合はNone）"""
+    global _kernel_module
+    with _kernel_lock:
+        if _kernel_module is False:
+            try:
+                from . import _kernels
+                _kernels.warmup()
+            except Exception:
+                # 失敗した場合は以降ずっとNumPy実装を使う
+                _kernel_module = None
+            else:
+                _kernel_module = _kernels
+        return _kernel_module
+
+def warmup_kernels() -> None:
+    """Numbaカーネルを事前にコンパイルする（利用できない場合は何もしない）"""
+    _load_kernels()
+
 class IPointCloudModel(ABC):
     @abstractmethod
     def set_point_cloud_data(self, pcd: o3d.geometry.PointCloud) -> None:
         """点群データの読み込み後の初期化"""
         pass
 
+    @abstractmethod
+    def set_z_range(self, min_z: float, max_z: float) -> None:
+        """現在のZ範囲を更新し、変化があればz_range_changedで通知する"""
+        pass
+
     @abstractmethod
     def get_polydata(self, min_z: float, max_z: float) -> Optional[pv.PolyData]:
-        """指定Z範囲におけるフィルタ済みの描画用PolyDataを返す"""
+        """指定Z範囲を描画するPolyDataを返す（範囲内に点が無ければNone）
+
+        毎回同じPolyDataを返し、点とスカラーは全点のまま保持する。
+        描画対象はその頂点セルをZ範囲内の点に差し替えることで絞り込む（返却オブジェクトを直接更新する）。
+        """
         pass
 
     @abstractmethod
@@ -38,13 +128,40 @@ class IPointCloudModel(ABC):
         """PGM/YAML変換を行い、生成ファイルのパスを返す"""
         pass
 
-class PointCloudModel(IPointCloudModel):
-    def __init__(self) -> None:
-        # 生データ（PGM変換用）
-        self.raw_points: Optional[np.ndarray] = None
+class MetaQObjectABC(type(QtCore.QObject), ABCMeta):
+    pass
+
+class PointCloudModel(QtCore.QObject, IPointCloudModel, metaclass=MetaQObjectABC):
+    # 現在のZ範囲の変更通知 (min_z, max_z)
+    z_range_changed = QtCore.pyqtSignal(float, float)
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        # 生データ（PGM変換用、z昇順に並べ替えて軸ごとに連続したfloat32配列で保持）
+        self.raw_x: Optional[np.ndarray] = None
+        self.raw_y: Optional[np.ndarray] = None
         self.raw_z: Optional[np.ndarray] = None
-        # 描画用（ダウンサンプリング済み）
+        # float32でも精度を保てるよう、XYはこのオフセットを引いた局所座標で保持する
+        self._xy_offset: Tuple[float, float] = (0.0, 0.0)
+        # 全点群のXY範囲 (min_x, max_x, min_y, max_y、局所座標)
+        self._xy_bounds: Optional[Tuple[float, float, float, float]] = None
+        # 描画用（ダウンサンプリング済み、点と"z"スカラーはz昇順のブロックごとにMorton順）
         self.display_cloud: Optional[pv.PolyData] = None
+        # 点はブロック内Morton順で保持し、z昇順のz値とその並びでの点番号を別に持つ
+        self._display_points: Optional[np.ndarray] = None
+        self._display_z: Optional[np.ndarray] = None
+        # 描画する点の範囲を切り替えるための頂点セル配列（offsets, connectivity=z昇順の点番号）
+        self._vert_offsets: Optional[np.ndarray] = None
+        self._vert_connectivity: Optional[np.ndarray] = None
+        # 現在描画している区間[lo, hi)
+        self._vert_range: Optional[Tuple[int, int]] = None
+        # PGM変換用の作業バッファ（変換のたびに再確保しないよう、最大サイズで保持して使い回す）
+        self._accum_buf: Optional[np.ndarray] = None
+        self._image_buf: Optional[np.ndarray] = None
+        # Numbaカーネルのスレッドごとの作業格子（大きさはカーネル側で上限を設けている）
+        self._scratch_buf: Optional[np.ndarray] = None
+        # NumPy実装の集計用格子（uint32のため桁あふれしない）
+        self._count_buf: Optional[np.ndarray] = None
 
         self.overall_z_min: Optional[float] = None
         self.overall_z_max: Optional[float] = None
@@ -52,39 +169,78 @@ class PointCloudModel(IPointCloudModel):
         self.current_max_z: Optional[float] = None
 
     def set_point_cloud_data(self, pcd: o3d.geometry.PointCloud) -> None:
-        self.raw_points = np.asarray(pcd.points)
-        if self.raw_points.size == 0:
+        points = np.asarray(pcd.points)
+        if points.size == 0:
             raise ValueError("生の点群が存在しません。")
-        self.raw_z = self.raw_points[:, 2]
-        self.overall_z_min = float(np.min(self.raw_z))
-        self.overall_z_max = float(np.max(self.raw_z))
+        # 地図座標系などで座標値が大きい場合もfloat32の有効桁を失わないよう、XY最小値を原点にする
+        self._xy_offset = (float(points[:, 0].min()), float(points[:, 1].min()))
+        raw_x = _to_float32(points[:, 0], self._xy_offset[0])
+        raw_y = _to_float32(points[:, 1], self._xy_offset[1])
+        raw_z = _to_float32(points[:, 2], 0.0)
+        # z昇順に並べ替えておくことで、Z範囲の抽出を二分探索による連続スライスで行える
+        z_order = np.argsort(raw_z)
+        self.raw_x = np.take(raw_x, z_order)
+        self.raw_y = np.take(raw_y, z_order)
+        self.raw_z = np.take(raw_z, z_order)
+        del raw_x, raw_y, raw_z, z_order
+        self.overall_z_min = float(self.raw_z[0])
+        self.overall_z_max = float(self.raw_z[-1])
+        self._xy_bounds = _xy_bounds(self.raw_x, self.raw_y)
         self.current_min_z = self.overall_z_min
         self.current_max_z = self.overall_z_max
 
-        # ダウンサンプリング
-        pcd_down = pcd.voxel_down_sample(VOXEL_SIZE)
-        down_points = np.asarray(pcd_down.points)
-        if down_points.size == 0:
-            self.display_cloud = None
-        else:
-            down_z = down_points[:, 2]
-            self.display_cloud = pv.PolyData(down_points)
-            self.display_cloud["z"] = down_z
+        # ダウンサンプリング（ボクセルごとに代表点を1点残す）
+        # 生データがz昇順なので、インデックス昇順に取り出せば描画用もz昇順になる
+        down_idx = _voxel_down_sample_indices(self.raw_x, self.raw_y, self.raw_z, VOXEL_SIZE)
+        down_x = np.take(self.raw_x, down_idx)
+        down_y = np.take(self.raw_y, down_idx)
+        self._display_z = np.take(self.raw_z, down_idx)
+        # 描画時のキャッシュ効率のため、z昇順の一定点数のブロック内だけ空間的に近い点が隣接するMorton順にする
+        # （ブロックの並びはz昇順のままなので、Z範囲の描画で参照する領域はほぼ連続したまま保たれる）
+        n_down = self._display_z.size
+        block = np.arange(n_down, dtype=np.uint64) // _MORTON_BLOCK_POINTS
+        morton_keys = (block << np.uint64(30)) | _morton_codes(down_x, down_y, self._display_z).astype(np.uint64)
+        morton_order = np.argsort(morton_keys, kind="stable")
+        del block, morton_keys
+        self._display_points = np.take(np.column_stack((down_x, down_y, self._display_z)), morton_order, axis=0)
+        # PolyDataはこれらの配列をコピーせずに参照する
+        self.display_cloud = pv.PolyData(self._display_points)
+        self.display_cloud["z"] = np.take(self._display_z, morton_order)
+        self._vert_offsets = np.arange(n_down + 1, dtype=pv.ID_TYPE)
+        # z昇順でi番目の点が、格納順の配列の何番目にあるか（同じブロック内の位置を指す）
+        self._vert_connectivity = np.empty(n_down, dtype=pv.ID_TYPE)
+        self._vert_connectivity[morton_order] = np.arange(n_down, dtype=pv.ID_TYPE)
+        # pv.PolyDataは生成時に全点分の頂点セルを持つ
+        self._vert_range = (0, n_down)
+
+    def set_z_range(self, min_z: float, max_z: float) -> None:
+        if min_z == self.current_min_z and max_z == self.current_max_z:
+            return
+        self.current_min_z = min_z
+        self.current_max_z = max_z
+        self.z_range_changed.emit(min_z, max_z)
 
     def get_polydata(self, min_z: float, max_z: float) -> Optional[pv.PolyData]:
         # 描画用のダウンサンプリング済みデータからフィルタ
-        if self.display_cloud is None:
-            return None
-        points = self.display_cloud.points
-        z = self.display_cloud["z"]
-        mask = (z >= min_z) & (z <= max_z)
-        filtered_points = points[mask]
-        if filtered_points.size == 0:
+        if self.display_cloud is None or self._display_z is None:
             return None
-        filtered_z = z[mask]
-        polydata = pv.PolyData(filtered_points)
-        polydata["z"] = filtered_z
-        return polydata
+        if min_z <= self.overall_z_min and max_z >= self.overall_z_max:
+            # 全範囲（初期表示・リセット時）は探索を省略
+            lo, hi = 0, self._display_z.size
+        else:
+            lo, hi = _z_slice(self._display_z, min_z, max_z)
+            if lo >= hi:
+                return None
+        if (lo, hi) == self._vert_range:
+            # 描画中の区間から変化が無ければPolyDataには触れない
+            return self.display_cloud
+        # 点とスカラーは全点のまま保持し、描画する頂点セルだけをz昇順の連続区間[lo, hi)に差し替える
+        # （セル配列も事前確保した配列のビューなので、点データのコピーもVTKオブジェクトの再生成も発生しない）
+        self.display_cloud.verts = pv.CellArray.from_arrays(
+            self._vert_offsets[:hi - lo + 1], self._vert_connectivity[lo:hi], deep=False
+        )
+        self._vert_range = (lo, hi)
+        return self.display_cloud
 
     def convert_to_pgm(
         self,
@@ -98,27 +254,61 @@ class PointCloudModel(IPointCloudModel):
         negate: int = 0,
     ) -> Tuple[str, str]:
         # 生データを用いてPGM/YAML変換を実施
-        if self.raw_points is None or self.raw_z is None:
+        if self.raw_x is None or self.raw_y is None or self.raw_z is None:
             raise ValueError("生の点群データが未初期化です。")
-        mask = (self.raw_z >= min_z) & (self.raw_z <= max_z)
-        filtered_points = self.raw_points[mask]
-        if filtered_points.size == 0:
+        lo, hi = _z_slice(self.raw_z, min_z, max_z)
+        if lo >= hi:
             raise ValueError("指定されたZ範囲内に生の点群が存在しません。")
-        # XY平面への投影と範囲計算
-        min_x = float(filtered_points[:, 0].min())
-        max_x = float(filtered_points[:, 0].max())
-        min_y = float(filtered_points[:, 1].min())
-        max_y = float(filtered_points[:, 1].max())
-        res_x = int(np.ceil((max_x - min_x) / resolution))
-        res_y = int(np.ceil((max_y - min_y) / resolution))
-
-        x_coords = filtered_points[:, 0]
-        y_coords = filtered_points[:, 1]
-        hist, _, _ = np.histogram2d(
-            x_coords, y_coords, bins=[res_x, res_y], range=[[min_x, max_x], [min_y, max_y]]
-        )
-        accum = np.flipud(hist.T).astype(np.int32)
-        image = np.where(accum >= MIN_OCCUPIED_POINTS, 0, 255).astype(np.uint8)
+        x_coords = self.raw_x[lo:hi]
+        y_coords = self.raw_y[lo:hi]
+        # XY平面への投影と範囲計算（全点を含む場合は読み込み時の値を再利用）
+        if lo == 0 and hi == self.raw_z.size and self._xy_bounds is not None:
+            min_x, max_x, min_y, max_y = self._xy_bounds
+        else:
+            min_x, max_x, min_y, max_y = _xy_bounds(x_coords, y_coords)
+        res_x = max(1, int(np.ceil((max_x - min_x) / resolution)))
+        res_y = max(1, int(np.ceil((max_y - min_y) / resolution)))
+
+        n_cells = res_x * res_y
+        if self._accum_buf is None or self._accum_buf.size < n_cells:
+            self._accum_buf = np.empty(n_cells, dtype=np.uint16)
+            self._image_buf = np.empty(n_cells, dtype=np.uint8)
+        accum = self._accum_buf[:n_cells].reshape(res_x, res_y)
+        image = self._image_buf[:n_cells].reshape(res_y, res_x)
+
+        inv_res = 1.0 / resolution
+        kernels = _load_kernels()
+        if kernels is not None:
+            # 量子化と集計を1回の走査で行う（全セルが上書きされる）
+            n_chunks = kernels.scratch_chunks(x_coords.size, n_cells)
+            scratch = None
+            if n_chunks > 1:
+                n_scratch = n_chunks * n_cells
+                if self._scratch_buf is None or self._scratch_buf.size < n_scratch:
+                    self._scratch_buf = np.empty(n_scratch, dtype=np.uint16)
+                scratch = self._scratch_buf[:n_scratch].reshape(n_chunks, n_cells)
+            kernels.rasterize(x_coords, y_coords, min_x, min_y, inv_res, res_x, res_y, accum, scratch)
+            counts = accum
+        else:
+            # 一定点数ずつ格子インデックスを計算して共有の格子へ加算し、一時配列の大きさを点数に依らず抑える
+            if self._count_buf is None or self._count_buf.size < n_cells:
+                self._count_buf = np.empty(n_cells, dtype=np.uint32)
+            counts_flat = self._count_buf[:n_cells]
+            counts_flat.fill(0)
+            for start in range(0, x_coords.size, _RASTER_CHUNK_POINTS):
+                stop = start + _RASTER_CHUNK_POINTS
+                # Numbaカーネルと同じくfloat64で量子化し、numbaの有無で出力が変わらないようにする
+                ix = np.floor(np.subtract(x_coords[start:stop], min_x, dtype=np.float64) * inv_res).astype(np.intp)
+                iy = np.floor(np.subtract(y_coords[start:stop], min_y, dtype=np.float64) * inv_res).astype(np.intp)
+                np.clip(ix, 0, res_x - 1, out=ix)
+                np.clip(iy, 0, res_y - 1, out=iy)
+                flat = ix * res_y + iy
+                np.add(counts_flat, np.bincount(flat, minlength=n_cells), out=counts_flat, casting="unsafe")
+            counts = counts_flat.reshape(res_x, res_y)
+        # 上下反転・転置したビューから、空き(255)/占有(0)をバッファへ直接書き込む
+        free = image.view(np.bool_)
+        np.less(counts.T[::-1], MIN_OCCUPIED_POINTS, out=free)
+        np.multiply(image, 255, out=image)
 
         # 出力ディレクトリの作成（存在しない場合）
         os.makedirs(output_dir, exist_ok=True)
@@ -128,16 +318,17 @@ class PointCloudModel(IPointCloudModel):
         self._save_pgm(output_pgm, image, res_x, res_y)
         # YAMLファイルの生成
         yaml_name = os.path.splitext(output_pgm)[0] + ".yaml"
-        self._save_yaml(yaml_name, os.path.basename(output_pgm), min_x, min_y, resolution, occupied_thresh, free_thresh, negate)
+        origin_x = min_x + self._xy_offset[0]
+        origin_y = min_y + self._xy_offset[1]
+        self._save_yaml(yaml_name, os.path.basename(output_pgm), origin_x, origin_y, resolution, occupied_thresh, free_thresh, negate)
         return output_pgm, yaml_name
 
     def _save_pgm(self, filename: str, image: np.ndarray, width: int, height: int) -> None:
-        with open(filename, "w") as f:
-            f.write("P2\n")
-            f.write(f"{width} {height}\n")
-            f.write("255\n")
-            for row in image:
-                f.write(" ".join(map(str, row)) + "\n")
+        # バイナリ形式(P5)で出力する（imageは(height, width)のuint8配列）
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        with open(filename, "wb") as f:
+            f.write(b"P5\n%d %d\n255\n" % (width, height))
+            image.tofile(f)
 
     def _save_yaml(
         self,
@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2025 Ryo Funai
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+高頻度なイベントを一定間隔に間引く（superqtのQSignalThrottlerのTrailing方式を参考にした簡易実装）
+"""
+from PyQt5 import QtCore
+
+class QSignalThrottler(QtCore.QObject):
+    triggered = QtCore.pyqtSignal()
+
+    def __init__(self, timeout: int, parent=None) -> None:
+        super().__init__(parent)
+        self._has_pending = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(timeout)
+        self._timer.timeout.connect(self._on_timeout)
+
+    def throttle(self) -> None:
+        """発火を要求する。timeout[ms]ごとに高々1回、区間の終わりにtriggeredが発火する"""
+        self._has_pending = True
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _on_timeout(self) -> None:
+        if not self._has_pending:
+            return
+        self._has_pending = False
+        self.triggered.emit()
+        # 発火直後の要求も次の区間の終わりまでまとめる
+        self._timer.start()
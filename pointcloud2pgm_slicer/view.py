@@ -5,12 +5,24 @@
 GUIの構築と更新を行う
 """
 from abc import ABC, ABCMeta, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator
 from PyQt5 import QtWidgets, QtCore
 from pyvistaqt import QtInteractor
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
+@contextmanager
+def signals_blocked(*widgets: QtCore.QObject) -> Iterator[None]:
+    """withブロック内で各ウィジェットのシグナル発火を抑止する"""
+    previous = [widget.blockSignals(True) for widget in widgets]
+    try:
+        yield
+    finally:
+        for widget, blocked in zip(widgets, previous):
+            widget.blockSignals(blocked)
+
 class IPointCloudView(ABC):
     @abstractmethod
     def update_spin_value(self, spin: QtWidgets.QDoubleSpinBox, value: float) -> None:
@@ -133,20 +145,25 @@ class PointCloudView(QtWidgets.QMainWindow, IPointCloudView, metaclass=MetaQWidg
         return QtWidgets.QPushButton(text)
 
     def update_spin_value(self, spin: QtWidgets.QDoubleSpinBox, value: float) -> None:
-        spin.blockSignals(True)
-        spin.setValue(value)
-        spin.blockSignals(False)
+        # 入力中のスピンボックスへ同じ値を書き戻すと表示が整形されて入力を妨げるため、値が同じなら何もしない
+        if spin.value() == value:
+            return
+        with signals_blocked(spin):
+            spin.setValue(value)
 
     def update_slider_value(self, slider: QtWidgets.QSlider, value: float) -> None:
-        slider.blockSignals(True)
-        slider.setValue(int(value * self.slider_multiplier))
-        slider.blockSignals(False)
+        # 浮動小数点誤差でスライダー値が1目盛りずれないよう四捨五入する
+        slider_value = int(round(value * self.slider_multiplier))
+        if slider.value() == slider_value:
+            return
+        with signals_blocked(slider):
+            slider.setValue(slider_value)
 
     def show_pgm_image(self, pgm_file: str) -> None:
         try:
-            with open(pgm_file, "r") as f:
+            with open(pgm_file, "rb") as f:
                 header = f.readline().strip()
-                if header != "P2":
+                if header != b"P5":
                     QtWidgets.QMessageBox.warning(self, "Error", "不明なPGM形式です。")
                     return
                 dims = f.readline().strip().split()
@@ -155,7 +172,7 @@ class PointCloudView(QtWidgets.QMainWindow, IPointCloudView, metaclass=MetaQWidg
                     return
                 width, height = int(dims[0]), int(dims[1])
                 _ = int(f.readline().strip())
-                data = np.array(f.read().split(), dtype=np.uint8)
+                data = np.frombuffer(f.read(), dtype=np.uint8)
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Error", f"PGM画像読み込み時にエラーが発生しました: {e}")
             return
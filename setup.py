@@ -13,4 +13,7 @@ setup(
         "pyvistaqt",
         "matplotlib"
     ],
+    extras_require={
+        "numba": ["numba"],
+    },
 )
@@ -0,0 +1,104 @@
+import os
+import sys
+from unittest import mock
+import numpy as np
+import open3d as o3d
+import pytest
+from PyQt5 import QtCore, QtWidgets
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from pointcloud2pgm_slicer.controller import PointCloudController
+from pointcloud2pgm_slicer.model import PointCloudModel
+from pointcloud2pgm_slicer.view import PointCloudView
+
+
+class FakeLoader(QtCore.QObject):
+    loaded = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+
+    def start(self):
+        pass
+
+class FakeView(QtWidgets.QWidget):
+    # 描画エリア以外はPointCloudViewと同じウィジェット・処理を使う
+    _create_slider_control = PointCloudView._create_slider_control
+    update_spin_value = PointCloudView.update_spin_value
+    update_slider_value = PointCloudView.update_slider_value
+
+    def __init__(self):
+        super().__init__()
+        self.slider_multiplier = 1000
+        self.user_output_filename = "output_map.pgm"
+        self.user_resolution = 0.2
+        self.actor = None
+        self.cloud_mesh = None
+        self.plotter = mock.MagicMock()
+        self.show_pgm_image = mock.MagicMock()
+        layout = QtWidgets.QHBoxLayout(self)
+        min_control, self.zmin_spin, self.zmin_slider = self._create_slider_control(0.0, 10.0, 0.0)
+        max_control, self.zmax_spin, self.zmax_slider = self._create_slider_control(0.0, 10.0, 10.0)
+        layout.addWidget(min_control)
+        layout.addWidget(max_control)
+        self.reset_button = QtWidgets.QPushButton()
+        self.convert_button = QtWidgets.QPushButton()
+        self.set_output_filename_button = QtWidgets.QPushButton()
+        self.set_resolution_button = QtWidgets.QPushButton()
+
+@pytest.fixture
+def controller(qtbot, tmp_path):
+    view = FakeView()
+    qtbot.addWidget(view)
+    loader = FakeLoader()
+    controller = PointCloudController(PointCloudModel(), view, loader, str(tmp_path))
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.array([
+        [0.0, 0.0, 0.0],
+        [1.0, 1.0, 1.0],
+        [2.0, 2.0, 2.0],
+        [3.0, 3.0, 3.0]
+    ]))
+    loader.loaded.emit(pcd)
+    return controller
+
+def test_type_into_zmin_spin(qtbot, controller):
+    view = controller.view
+    view.zmin_spin.lineEdit().selectAll()
+    qtbot.keyClicks(view.zmin_spin, "1.25")
+    # 入力途中の値が書き戻しで整形されず、入力した値がそのまま反映されるか
+    assert view.zmin_spin.text() == "1.25"
+    assert controller.model.current_min_z == 1.25
+    assert view.zmin_slider.value() == 1250
+
+def test_zmin_slider_pushes_zmax(qtbot, controller):
+    view = controller.view
+    view.zmax_spin.lineEdit().selectAll()
+    qtbot.keyClicks(view.zmax_spin, "1")
+    view.zmin_slider.setValue(2000)
+    # min zがmax zを超えるとmax z側のウィジェットも追従するか
+    assert controller.model.current_min_z == 2.0
+    assert controller.model.current_max_z == 2.0
+    assert view.zmax_spin.value() == 2.0
+    assert view.zmax_slider.value() == 2000
+
+def test_convert_reenables_button(qtbot, controller, monkeypatch):
+    information = mock.MagicMock()
+    monkeypatch.setattr(QtWidgets.QMessageBox, "information", information)
+    view = controller.view
+    controller.on_convert()
+    # 変換中はボタンが無効化され、完了後に再度有効化されるか
+    assert not view.convert_button.isEnabled()
+    qtbot.waitUntil(view.convert_button.isEnabled)
+    information.assert_called_once()
+    view.show_pgm_image.assert_called_once()
+    assert os.path.exists(view.show_pgm_image.call_args[0][0])
+
+def test_convert_failure_reenables_button(qtbot, controller, monkeypatch):
+    critical = mock.MagicMock()
+    monkeypatch.setattr(QtWidgets.QMessageBox, "critical", critical)
+    view = controller.view
+    # 点の存在しないZ範囲では変換が失敗する
+    controller.model.set_z_range(1.25, 1.5)
+    controller.on_convert()
+    assert not view.convert_button.isEnabled()
+    qtbot.waitUntil(view.convert_button.isEnabled)
+    critical.assert_called_once()
+    view.show_pgm_image.assert_not_called()
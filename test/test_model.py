@@ -3,10 +3,15 @@ import numpy as np
 import open3d as o3d
 import pytest
 import sys
+import types
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "pointcloud2pgm_slicer")))
 from model import PointCloudModel
 
 
+def _drawn_point_ids(polydata):
+    # 頂点セルは [1, id, 1, id, ...] の形式
+    return polydata.verts.reshape(-1, 2)[:, 1]
+
 @pytest.fixture
 def sample_point_cloud():
     # ダミーの点群データを生成する
@@ -35,9 +40,35 @@ def test_get_polydata(sample_point_cloud):
     # 1.0～2.0の範囲に該当する点は [1,1,1] と [2,2,2] の2点
     polydata = model.get_polydata(1.0, 2.0)
     assert polydata is not None
-    np_points = polydata.points
+    # 点データは全点のまま保持され、描画される頂点セルだけが絞り込まれる
+    np_points = polydata.points[_drawn_point_ids(polydata)]
     assert np_points.shape[0] == 2
 
+def test_get_polydata_full_range(sample_point_cloud):
+    model = PointCloudModel()
+    model.set_point_cloud_data(sample_point_cloud)
+    model.get_polydata(1.0, 2.0)
+    # 全範囲では描画用の点群全体がそのまま返る
+    polydata = model.get_polydata(model.overall_z_min, model.overall_z_max)
+    assert polydata is model.display_cloud
+    assert polydata.n_verts == polydata.n_points
+
+def test_get_polydata_unsorted_input():
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.array([
+        [3.0, 3.0, 3.0],
+        [0.0, 0.0, 0.0],
+        [2.0, 2.0, 2.0],
+        [1.0, 1.0, 1.0]
+    ]))
+    model = PointCloudModel()
+    model.set_point_cloud_data(pcd)
+    # 入力順に依存せず、Z範囲内の点だけが抽出されるか
+    polydata = model.get_polydata(0.5, 2.5)
+    assert polydata is not None
+    assert sorted(polydata["z"][_drawn_point_ids(polydata)].tolist()) == [1.0, 2.0]
+    assert model.get_polydata(3.5, 4.0) is None
+
 def test_convert_to_pgm(tmp_path, sample_point_cloud):
     model = PointCloudModel()
     model.set_point_cloud_data(sample_point_cloud)
@@ -57,7 +88,111 @@ def test_convert_to_pgm(tmp_path, sample_point_cloud):
     # ファイルが出力されているか確認
     assert os.path.exists(pgm_path)
     assert os.path.exists(yaml_path)
-    # PGMファイルの最初の行が "P2" となっているかチェック
-    with open(pgm_path, "r") as f:
+    # PGMファイルの最初の行が "P5" となっているかチェック
+    with open(pgm_path, "rb") as f:
         header = f.readline().strip()
-    assert header == "P2"
+    assert header == b"P5"
+
+def test_convert_to_pgm_occupancy(tmp_path, sample_point_cloud):
+    model = PointCloudModel()
+    model.set_point_cloud_data(sample_point_cloud)
+    pgm_path, _ = model.convert_to_pgm(
+        min_z=0.0,
+        max_z=3.0,
+        resolution=1.0,
+        output_dir=str(tmp_path),
+        output_filename="test_map.pgm",
+    )
+    with open(pgm_path, "rb") as f:
+        assert f.readline().strip() == b"P5"
+        assert f.readline().split() == [b"3", b"3"]
+        assert f.readline().strip() == b"255"
+        image = np.frombuffer(f.read(), dtype=np.uint8).reshape(3, 3)
+    # 対角線上の点が占有(0)、それ以外が空き(255)となり、上端がy最大側
+    expected = np.array([
+        [255, 255, 0],
+        [255, 0, 255],
+        [0, 255, 255],
+    ], dtype=np.uint8)
+    np.testing.assert_array_equal(image, expected)
+
+def test_convert_to_pgm_without_numba(tmp_path, monkeypatch):
+    pytest.importorskip("numba")
+    rng = np.random.default_rng(0)
+    points = rng.uniform([5e5, 4e6, -2.0], [5e5 + 80.0, 4e6 + 60.0, 5.0], (300000, 3))
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(points)
+    model = PointCloudModel()
+    model.set_point_cloud_data(pcd)
+    numba_pgm, _ = model.convert_to_pgm(0.0, 2.0, 0.05, str(tmp_path), "numba.pgm")
+    # NumPy実装に切り替えても同じPGMが出力されるか
+    monkeypatch.setattr(sys.modules[PointCloudModel.__module__], "_load_kernels", lambda: None)
+    numpy_pgm, _ = model.convert_to_pgm(0.0, 2.0, 0.05, str(tmp_path), "numpy.pgm")
+    with open(numba_pgm, "rb") as f_numba, open(numpy_pgm, "rb") as f_numpy:
+        assert f_numba.read() == f_numpy.read()
+
+def test_convert_to_pgm_large_offset(tmp_path):
+    rng = np.random.default_rng(1)
+    base = rng.uniform([0.0, 0.0, 0.0], [50.0, 40.0, 3.0], (100000, 3))
+    outputs = []
+    for offset in (0.0, 5e5):
+        points = base.copy()
+        points[:, :2] += offset
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(points)
+        model = PointCloudModel()
+        model.set_point_cloud_data(pcd)
+        output_dir = tmp_path / str(offset)
+        pgm_path, yaml_path = model.convert_to_pgm(0.5, 2.5, 0.05, str(output_dir), "map.pgm")
+        with open(pgm_path, "rb") as f:
+            pgm = f.read()
+        with open(yaml_path) as f:
+            origin_line = next(line for line in f if line.startswith("origin:"))
+        origin = [float(v) for v in origin_line.split(":", 1)[1].strip(" []\n").split(",")]
+        outputs.append((pgm, origin))
+    # 地図座標系の大きな座標値でも同じPGMが得られ、originにはオフセットが戻されているか
+    (pgm, origin), (shifted_pgm, shifted_origin) = outputs
+    assert shifted_pgm == pgm
+    assert shifted_origin[0] == pytest.approx(origin[0] + 5e5, abs=1e-6)
+    assert shifted_origin[1] == pytest.approx(origin[1] + 5e5, abs=1e-6)
+    assert shifted_origin[2] == 0.0
+
+def test_convert_to_pgm_kernel_compile_failure(tmp_path, monkeypatch, sample_point_cloud):
+    model_module = sys.modules[PointCloudModel.__module__]
+    warmup_calls = []
+
+    def failing_warmup():
+        warmup_calls.append(None)
+        raise RuntimeError("compile failed")
+
+    # コンパイルに失敗するカーネルに差し替える
+    kernels = types.ModuleType("_kernels")
+    kernels.warmup = failing_warmup
+    package = sys.modules[model_module.__package__]
+    monkeypatch.setattr(package, "_kernels", kernels, raising=False)
+    monkeypatch.setitem(sys.modules, model_module.__package__ + "._kernels", kernels)
+    monkeypatch.setattr(model_module, "_kernel_module", False)
+
+    model_module.warmup_kernels()
+    model = PointCloudModel()
+    model.set_point_cloud_data(sample_point_cloud)
+    # 例外を出さずにNumPy実装へ切り替わり、コンパイルは再試行されないか
+    pgm_path, _ = model.convert_to_pgm(0.0, 3.0, 1.0, str(tmp_path), "test_map.pgm")
+    assert os.path.exists(pgm_path)
+    assert model_module._load_kernels() is None
+    assert len(warmup_calls) == 1
+
+def test_get_polydata_random_cloud():
+    rng = np.random.default_rng(2)
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(rng.uniform([0.0, 0.0, 0.0], [40.0, 30.0, 5.0], (50000, 3)))
+    model = PointCloudModel()
+    model.set_point_cloud_data(pcd)
+    polydata = model.get_polydata(1.5, 3.5)
+    assert polydata is not None
+    z = polydata["z"]
+    drawn_ids = _drawn_point_ids(polydata)
+    # 格納順が並べ替えられていても、描画される点はZ範囲内の点とちょうど一致するか
+    assert np.unique(drawn_ids).size == drawn_ids.size
+    assert np.all((z[drawn_ids] >= 1.5) & (z[drawn_ids] <= 3.5))
+    assert drawn_ids.size == np.count_nonzero((z >= 1.5) & (z <= 3.5))